@@ -73,6 +73,7 @@ from . import hcam
 from . import hlog
 from . import support
 from . import fitting
+from . import stack
 from . import defect
 from . import scripts
 
@@ -170,7 +170,7 @@ class CCD(Agroup):
         for wind in self.values():
             try:
                 wind_small = wind.window(xlo, xhi, ylo, yhi)
-                arrs.append(wind_small.data.flatten())
+                arrs.append(wind_small.data.ravel())
             except HipercamError as err:
                 # could get errors if window not aligned
                 # with xlo/xhi/ylo/yhi
@@ -182,8 +182,9 @@ class CCD(Agroup):
         # concatenate into 1D array
         arr = np.concatenate(arrs)
 
-        # Then compute percentiles
-        return np.percentile(arr, q)
+        # Then compute percentiles. 'arr' is our own copy so it can be
+        # partitioned in place.
+        return np.percentile(arr, q, overwrite_input=True)
 
     def whdul(self, hdul=None, cnam=None, xoff=0, yoff=0):
         """Write the :class:`CCD` as a series of HDUs, one per
@@ -13,6 +13,10 @@ from . import support
 
 __all__ = ("combFit", "fitMoffat", "fitGaussian", "moffat", "gaussian")
 
+# 4*ln(2), which relates the FWHM to the profile parameters. Being a
+# global, numba compiles it in as a constant.
+FOUR_LN2 = 4.0 * np.log(2.0)
+
 
 def combFit(
     wind,
@@ -635,6 +639,9 @@ def dmoffat(
     tbeta = max(0.01, beta)
     alpha = 4 * (2 ** (1 / tbeta) - 1) / fwhm ** 2
 
+    # factor in the beta derivative arising through alpha
+    dbfac = FOUR_LN2 * 2 ** (1 / tbeta) / tbeta / fwhm ** 2
+
     dsky = np.ones_like(x)
 
     if ndiv > 0:
@@ -684,17 +691,7 @@ def dmoffat(
                             dfwhm += (2 * alpha * tbeta / fwhm) * save2
 
                         if comp_dbeta:
-                            dbeta += (
-                                -np.log(denom) * height * dh
-                                + (
-                                    4.0
-                                    * np.log(2)
-                                    * 2 ** (1 / tbeta)
-                                    / tbeta
-                                    / fwhm ** 2
-                                )
-                                * save2
-                            )
+                            dbeta += -np.log(denom) * height * dh + dbfac * save2
 
         # Normalise by number of evaluations
         nadd = xbin * ybin * ndiv ** 2
@@ -739,10 +736,7 @@ def dmoffat(
 
         if comp_dfwhm and comp_dbeta:
             dfwhm = (2 * alpha * tbeta / fwhm) * save2
-            dbeta = (
-                -np.log(denom) * height * dheight
-                + (4.0 * np.log(2) * 2 ** (1 / tbeta) / tbeta / fwhm ** 2) * save2
-            )
+            dbeta = -np.log(denom) * height * dheight + dbfac * save2
             return (dsky, dheight, dxcen, dycen, dfwhm, dbeta)
 
         elif comp_dfwhm:
@@ -750,10 +744,7 @@ def dmoffat(
             return (dsky, dheight, dxcen, dycen, dfwhm, dfwhm)
 
         elif comp_dbeta:
-            dbeta = (
-                -np.log(denom) * height * dheight
-                + (4.0 * np.log(2) * 2 ** (1 / tbeta) / tbeta / fwhm ** 2) * save2
-            )
+            dbeta = -np.log(denom) * height * dheight + dbfac * save2
             return (dsky, dheight, dxcen, dycen, dbeta, dbeta)
 
         else:
@@ -1218,6 +1209,7 @@ def fitGaussian(
 
             # reject any above the defined threshold
             gfit.sigma[ok & (np.abs(resid) > sfac * thresh)] *= -1
+            gfit.select()
 
             # check whether any have been rejected
             ok = gfit.mask & (gfit.sigma > 0)
@@ -1314,7 +1306,7 @@ def gaussian(x, y, sky, height, xcen, ycen, fwhm, xbin, ybin, ndiv):
 
     """
 
-    alpha = 4.0 * np.log(2.0) / fwhm ** 2
+    alpha = FOUR_LN2 / fwhm ** 2
 
     if ndiv > 0:
         # Complicated case with sub-pixellation allowed for
@@ -1406,7 +1398,7 @@ def dgaussian(x, y, sky, height, xcen, ycen, fwhm, xbin, ybin, ndiv, comp_dfwhm)
     appear in the function call.
 
     """
-    alpha = 4.0 * np.log(2.0) / fwhm ** 2
+    alpha = FOUR_LN2 / fwhm ** 2
 
     dsky = np.ones_like(x)
 
@@ -1523,8 +1515,21 @@ class Gfit:
         self.ybin = wind.ybin
         self.ndiv = ndiv
         self.mask = _mask(wind, self.x, self.y)
+        self.select()
         self.set_mode(mode, fwhm)
 
+    def select(self):
+        """Picks out the pixels to fit, i.e. those inside the mask with
+        positive uncertainties, as 1D arrays so that the model need only be
+        computed at these pixels at each step of the fit. Must be called
+        after any change to the uncertainties.
+        """
+        ok = self.mask & (self.sigma > 0)
+        self.xok = self.x[ok]
+        self.yok = self.y[ok]
+        self.dok = self.data[ok]
+        self.sok = self.sigma[ok]
+
     def set_mode(self, mode, fwhm):
         """Set the operation mode with some light checks"""
         if mode not in ("sf", "s", "f", ""):
@@ -1604,10 +1609,20 @@ class Gfit:
         Returns 1D array of normalised residuals. See the model
         method for a description of the argument 'param'
         """
-        mod = self.model(param)
-        diff = (self.data - mod) / self.sigma
-        ok = self.mask & (self.sigma > 0)
-        return diff[ok].ravel()
+        sky, height, xcen, ycen, fwhm = self.get_par(param)
+        mod = gaussian(
+            self.xok,
+            self.yok,
+            sky,
+            height,
+            xcen,
+            ycen,
+            fwhm,
+            self.xbin,
+            self.ybin,
+            self.ndiv,
+        )
+        return (self.dok - mod) / self.sok
 
     def jac(self, param):
         """
@@ -1632,8 +1647,8 @@ class Gfit:
             raise HipercamError("invalid mode")
 
         derivs = dgaussian(
-            self.x,
-            self.y,
+            self.xok,
+            self.yok,
             sky,
             height,
             xcen,
@@ -1645,10 +1660,7 @@ class Gfit:
             comp_fwhm,
         )
 
-        ok = self.mask & (self.sigma > 0)
-        return np.column_stack(
-            [(-derivs[ind][ok] / self.sigma[ok]).ravel() for ind in inds]
-        )
+        return np.column_stack([-derivs[ind] / self.sok for ind in inds])
 
     def model(self, param):
         """
@@ -813,6 +813,9 @@ class Rdata(Rhead):
             else:
                 self.seek_frame(nframe)
 
+            # buffer re-used for the pixel data of each frame read
+            self._frame = np.empty((self._framesize - self.ntbytes) // 2, ">u2")
+
     # Rdata objects functions as iterators.
     def __iter__(self):
         return self
@@ -950,10 +953,11 @@ class Rdata(Rhead):
 
             # read in frame and then the timing data, correcting the frame for
             # the standard FITS BZERO offset. At this stage we have the data
-            # as unsigned 2-byte ints
-            frame = np.fromfile(
-                self._ffile, ">u2", (self._framesize - self.ntbytes) // 2
-            )
+            # as unsigned 2-byte ints. The frame is read into the same buffer
+            # each time; this is safe because the Windows are built from
+            # float32 copies of it.
+            frame = self._frame
+            self._ffile.readinto(frame)
             frame += BZERO
             tbytes = self._ffile.read(self.ntbytes)
             if len(tbytes) != self.ntbytes:
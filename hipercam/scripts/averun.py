@@ -84,7 +84,8 @@ def averun(args=None):
            Name of flat field to divide by, 'none' to ignore.
 
         method : string [hidden, defaults to 'm']
-           'm' for median, 'c' for clipped mean. See below for pros and cons.
+           'm' for median, 'c' for clipped mean, 'a' for approximate median.
+           See `combine` for pros and cons.
 
         sigma : float [hidden; if method == 'c']
            With clipped mean combination, pixels that deviate by more than
@@ -191,7 +192,10 @@ def averun(args=None):
 
         cl.set_default("method", "m")
         method = cl.get_value(
-            "method", "c(lipped mean), m(edian)", "c", lvals=("c", "m")
+            "method",
+            "c(lipped mean), m(edian), a(pproximate median)",
+            "c",
+            lvals=("c", "m", "a"),
         )
 
         if method == "c":
@@ -256,7 +260,7 @@ def averun(args=None):
 
     try:
         print("\nCalling 'combine' ...")
-        if method == "m":
+        if method == "m" or method == "a":
             args = [
                 None,
                 "prompt",
@@ -1,5 +1,6 @@
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -7,6 +8,7 @@ import matplotlib.pyplot as plt
 import hipercam as hcam
 from hipercam import cline, utils, support, spooler
 from hipercam.cline import Cline
+from hipercam.stack import stack_buffers, median, approx_median, BA_NMIN
 
 __all__ = [
     "combine",
@@ -43,7 +45,8 @@ def combine(args=None):
            Name of flat field frame to subtract, 'none' to ignore.
 
         method  : string
-           'm' for median, 'c' for clipped mean. See below for pros and cons.
+           'm' for median, 'c' for clipped mean, 'a' for an approximate
+           median. See below for pros and cons.
 
         sigma   : float [if method == 'c']
            With clipped mean combination, pixels that deviate by more than
@@ -80,11 +83,21 @@ def combine(args=None):
        readout noise, and the +/- 0.5 count uncertainty of median combination
        may be worse than this.
 
+       The approximate median uses the "binapprox" algorithm of Tibshirani
+       (2008) which bins the values of each pixel within +/- 1 RMS of their
+       mean into 1000 bins and returns the centre of the bin containing the
+       median (the mean of the centres of the bins containing the two middle
+       values for an even number of frames). It is faster than the exact median for large numbers of
+       frames, with an error of order RMS/1000, which should be negligible
+       compared to the noise. The exact median is used for 20 frames or
+       fewer where there is no gain.
+
     .. Note::
 
-       This routine reads all inputs into memory, so can be a bit of a
-       hog. However, it does so one CCD at a time to alleviate this. It will
-       fail if it cannot find a valid frame for any CCD.
+       This routine holds all inputs in memory, so can be a bit of a
+       hog. However, it does so one CCD at a time, stacking the data into a
+       single buffer as each file is read, to alleviate this. It will fail if
+       it cannot find a valid frame for any CCD.
 
     """
 
@@ -145,7 +158,10 @@ def combine(args=None):
             flat = hcam.MCCD.read(flat)
 
         method = cl.get_value(
-            "method", "c(lipped mean), m(edian)", "c", lvals=("c", "m")
+            "method",
+            "c(lipped mean), m(edian), a(pproximate median)",
+            "c",
+            lvals=("c", "m", "a"),
         )
 
         if method == "c":
@@ -192,155 +208,219 @@ def combine(args=None):
 
     # inputs done with
 
-    # Read the first file of the list to act as a template
-    # for the CCD names etc.
+    # Read the first file of the list to act as a template for the CCD
+    # names etc, counting the files to size the buffers used to combine
+    # them.
     with open(flist) as fin:
+        nfile = 0
         for line in fin:
             if not line.startswith("#") and not line.isspace():
-                template_name = line.strip()
-                break
-        else:
-            raise hcam.HipercamError("List = {:s} is empty".format(flist))
+                if nfile == 0:
+                    template_name = line.strip()
+                nfile += 1
 
-    template = hcam.MCCD.read(utils.add_extension(template_name, hcam.HCAM))
+    if nfile == 0:
+        raise hcam.HipercamError("List = {:s} is empty".format(flist))
 
-    if bias is not None:
-        # crop the bias
-        bias = bias.crop(template)
-
-    if dark is not None:
-        # crop the dark
-        dark = dark.crop(template)
+    template = hcam.MCCD.read(utils.add_extension(template_name, hcam.HCAM))
 
-    if flat is not None:
-        # crop the flat
-        flat = flat.crop(template)
+    # Pool of 3D buffers used to stack windows, keyed by shape so that they
+    # can be re-used for any CCDs with windows of the same format. Each entry
+    # is a list as windows of the same CCD may share a shape.
+    stacks = {}
 
     # Now process each file CCD by CCD to reduce the memory
     # footprint
     for cnam in template:
 
-        # Read files into memory, insisting that they
-        # all have the same set of CCDs
+        # Read files one by one, insisting that they all have the same set
+        # of CCDs
         print("\nLoading all CCDs labelled '{:s}' from {:s}".format(cnam, flist))
 
-        ccds, means = [], []
-        nrej, ntot = 0, 0
-        with spooler.HcamListSpool(flist, cnam) as spool:
-
-            if bias is not None:
-                # extract relevant CCD from the bias
-                bccd = bias[cnam]
-                bexpose = bias.head.get("EXPTIME", 0.0)
-            else:
-                bexpose = 0.0
-
-            if dark is not None:
-                # extract relevant CCD from the dark
-                dccd = dark[cnam]
-                dexpose = dark.head["EXPTIME"]
+        # Crop the calibration CCDs as we need them. Cropping gives views of
+        # the original data unless it has to rebin, so only the current
+        # CCD's rebinned copies are held in memory at any one time.
+        if bias is not None:
+            # extract relevant CCD from the bias
+            bccd = bias[cnam].crop(template[cnam])
+            bexpose = bias.head.get("EXPTIME", 0.0)
+        else:
+            bexpose = 0.0
 
-            if flat is not None:
-                # extract relevant CCD from the flat
-                fccd = flat[cnam]
+        if dark is not None:
+            # extract relevant CCD from the dark
+            dccd = dark[cnam].crop(template[cnam])
+            dexpose = dark.head["EXPTIME"]
 
-            mean = None
+        if flat is not None:
+            # extract relevant CCD from the flat
+            fccd = flat[cnam].crop(template[cnam])
+
+        # Set up 3D buffers to take the data arrays, re-using any buffer of
+        # the right format left over from earlier CCDs. There is room for
+        # every file of the list although blank frames may leave some of it
+        # unused.
+        arr3ds = stack_buffers(stacks, template[cnam], nfile)
+
+        # Gather everything needed per window once, rather than looking it
+        # up for every window of every frame
+        wcals = [
+            (
+                wnam,
+                arr3d,
+                None if bias is None else bccd[wnam].data,
+                None if dark is None else dccd[wnam].data,
+                None if flat is None else fccd[wnam].data,
+            )
+            for wnam, arr3d in arr3ds.items()
+        ]
+
+        # Copy the data into the buffers as they are read, calibrating as we
+        # go, so that only one CCD is held in memory outside the buffers. The
+        # bias is subtracted as part of the copy to save a pass through the
+        # data.
+        means = []
+        nrej, ntot = 0, 0
+        mean, nccd = None, 0
+        with spooler.HcamListSpool(flist, cnam) as spool:
             for ccd in spool:
 
                 if ccd.is_data():
 
-                    if bias is not None:
-                        # subtract bias
-                        ccd -= bccd
-
                     if dark is not None:
-                        # subtract dark
                         scale = (ccd.head["EXPTIME"] - bexpose) / dexpose
-                        ccd -= scale * dccd
-
-                    if flat is not None:
-                        # apply flat
-                        ccd /= fccd
 
-                    # keep the result
-                    ccds.append(ccd)
+                    slots = []
+                    for wnam, arr3d, bdata, ddata, fdata in wcals:
+                        slot = arr3d[..., nccd]
 
-                    if (adjust == "b" or adjust == "n") and mean is None:
-                        # store the first mean [median]
-                        if usemean:
-                            mean = ccd.mean()
+                        if bdata is not None:
+                            # subtract bias
+                            np.subtract(ccd[wnam].data, bdata, out=slot)
                         else:
-                            mean = ccd.median()
-
-            if len(ccds) == 0:
-                raise hcam.HipercamError(
-                    "Found no valid examples of CCD {:s}"
-                    " in list = {:s}".format(cnam, flist)
-                )
-
-            else:
-                print("Loaded {:d} CCDs".format(len(ccds)))
+                            slot[...] = ccd[wnam].data
 
-        if adjust == "b" or adjust == "n":
+                        if ddata is not None:
+                            # subtract dark
+                            slot -= scale * ddata
 
-            # adjust the means
-            print("Computing and adjusting their mean levels")
+                        if fdata is not None:
+                            # apply flat
+                            slot /= fdata
 
-            # now carry out the adjustments
-            for ccd in ccds:
-                if usemean:
-                    cmean = ccd.mean()
-                else:
-                    cmean = ccd.median()
-
-                means.append(cmean)
-                if adjust == "b":
-                    ccd += mean - cmean
-                elif adjust == "n":
-                    ccd *= mean / cmean
+                        slots.append(slot)
 
-            if plot:
-                plt.plot(means)
-                plt.plot(means, ".k")
-                plt.text(len(means) + 1, means[-1], cnam, va="center", ha="left")
+                    if adjust == "b" or adjust == "n":
+                        # adjust the mean [median] to match the first
+                        if usemean:
+                            cmean = sum(slot.sum() for slot in slots) / sum(
+                                slot.size for slot in slots
+                            )
+                        else:
+                            cmean = np.median(
+                                np.concatenate([slot.ravel() for slot in slots])
+                            )
+
+                        if mean is None:
+                            # store the first mean [median]
+                            mean = cmean
+
+                        means.append(cmean)
+                        for slot in slots:
+                            if adjust == "b":
+                                slot += mean - cmean
+                            elif adjust == "n":
+                                slot *= mean / cmean
+
+                    nccd += 1
+
+        if nccd == 0:
+            raise hcam.HipercamError(
+                "Found no valid examples of CCD {:s}"
+                " in list = {:s}".format(cnam, flist)
+            )
 
-        # Finally, combine
+        else:
+            print("Loaded {:d} CCDs".format(nccd))
+            if adjust == "b" or adjust == "n":
+                print("Computed and adjusted their mean levels")
+
+        if nccd < nfile:
+            # drop the unused part of the buffers. This leaves them
+            # non-contiguous, which 'median' sorts out band by band.
+            arr3ds = {wnam: arr3d[..., :nccd] for wnam, arr3d in arr3ds.items()}
+
+        if plot:
+            plt.plot(means)
+            plt.plot(means, ".k")
+            plt.text(len(means) + 1, means[-1], cnam, va="center", ha="left")
+
+        # Finally, combine. At this point, each arr3d is a 3D array, with the
+        # last dimension (axis=-1) running over the images. We want to
+        # average / median over this axis.
         if method == "m":
             print("Combining them (median) and storing the result")
+        elif method == "a":
+            print("Combining them (approximate median) and storing the result")
         elif method == "c":
             print("Combining them (clipped mean) and storing the result")
         else:
             raise NotImplementedError("method = {:s} not implemented".format(method))
 
-        for wnam, wind in template[cnam].items():
-
-            # build list of all data arrays
-            arrs = [ccd[wnam].data for ccd in ccds]
-            arr3d = np.stack(arrs)
-
-            # at this point, arr3d is a 3D array, with the first dimension
-            # (axis=0) running over the images. We want to average / median
-            # over this axis.
-
-            if method == "m":
-                # median
-                wind.data = np.median(arr3d, axis=0)
+        for wind in template[cnam].values():
+            # the results are written straight into the template's data, so
+            # make sure that it is a native float32 array which can be
+            # written out without conversion
+            if wind.data.dtype != np.float32 or not wind.data.flags.c_contiguous:
+                wind.data = np.empty(wind.data.shape, np.float32)
+
+        if method == "m" or method == "a":
+            # median, straight into the output Windows. The windows are
+            # split into bands of rows which are independent of each other
+            # and spread over a pool of threads; the medians are computed in
+            # compiled code which releases the GIL.
+            if method == "a" and nccd > BA_NMIN:
+                func = approx_median
+            else:
+                func = median
+
+            nthread = os.cpu_count() or 1
+            with ThreadPoolExecutor(nthread) as executor:
+                jobs = []
+                for wnam, wind in template[cnam].items():
+                    nband = min(nthread, wind.ny)
+                    for arr3d, out in zip(
+                        np.array_split(arr3ds[wnam], nband),
+                        np.array_split(wind.data, nband),
+                    ):
+                        jobs.append(executor.submit(func, arr3d, out))
+
+            # raises any exception from the threads
+            for job in jobs:
+                job.result()
 
-            elif method == "c":
-                # Cython routine avgstd requires np.float32 input
-                arr3d = arr3d.astype(np.float32)
+        elif method == "c":
+            for wnam, wind in template[cnam].items():
                 if sigma > 0.0:
+                    # Cython routine avgstd requires np.float32 input with
+                    # the images along the first axis; a transposed view
+                    # will do.
+                    arr3d = np.moveaxis(arr3ds[wnam], -1, 0)
                     avg, std, num = support.avgstd(arr3d, sigma)
-                    nrej += len(ccds) * num.size - num.sum()
-                    ntot += len(ccds) * num.size
+                    nrej += nccd * num.size - num.sum()
+                    ntot += nccd * num.size
+                    wind.data = avg
                 else:
-                    avg = np.mean(arr3d, axis=0)
-                wind.data = avg
+                    np.mean(arr3ds[wnam], axis=-1, out=wind.data)
 
         # Add history
         if method == "m":
             template[cnam].head.add_history(
-                "Median combine of {:d} images".format(len(ccds))
+                "Median combine of {:d} images".format(nccd)
+            )
+        elif method == "a":
+            template[cnam].head.add_history(
+                "Approximate median combine of {:d} images".format(nccd)
             )
         elif method == "c":
             print(
@@ -350,10 +430,13 @@ def combine(args=None):
             )
             template[cnam].head.add_history(
                 "Clipped mean combine of {:d} images, sigma = {:.1f}".format(
-                    len(ccds), sigma
+                    nccd, sigma
                 )
             )
 
+    # release the stacking buffers
+    stacks.clear()
+
     # write out
     template.write(outfile, clobber)
     print("\nFinal result written to {:s}".format(outfile))
@@ -8,6 +8,7 @@ import numpy as np
 import hipercam as hcam
 from hipercam import cline, utils, spooler
 from hipercam.cline import Cline
+from hipercam.stack import median, stack_buffers
 
 __all__ = [
     "makeflat",
@@ -412,6 +413,10 @@ def makeflat(args=None):
             # normalisation at the end of the loop
             wsum = 0.0
 
+            # pool of 3D buffers to stack the windows of each group so that
+            # they can be re-used from group to group
+            stacks = {}
+
             for n in range(nchunk):
                 # loop through in chunks of ngroup at a time with a
                 # potentially larger group to sweep up the end ones.
@@ -420,11 +425,15 @@ def makeflat(args=None):
                 if n == nchunk:
                     n2 = len(mkeys)
 
-                # load the CCDs of this group
-                ccdgroup = []
-                with spooler.HcamListSpool(list(mkeys[n1:n2]), cnam) as spool:
-                    for ccd in spool:
-                        ccdgroup.append(ccd)
+                # load the CCDs of this group, copying the data of each
+                # window straight into a 3D buffer with the images running
+                # along the last axis.
+                group = list(mkeys[n1:n2])
+                arr3ds = stack_buffers(stacks, tccd, len(group))
+                with spooler.HcamListSpool(group, cnam) as spool:
+                    for nc, ccd in enumerate(spool):
+                        for wnam, arr3d in arr3ds.items():
+                            arr3d[..., nc] = ccd[wnam].data
 
                 # take median of the group to get rid of jumping
                 # stars. 'weight' used to weight the results when summing the
@@ -435,20 +444,15 @@ def makeflat(args=None):
                 wsum += weight
 
                 for wnam, wind in tccd.items():
-                    # go through each window, building a list of all data
-                    # arrays
-                    arrs = [ccd[wnam].data for ccd in ccdgroup]
-                    arr3d = np.stack(arrs)
-
-                    # at this point, arr3d is a 3D array, with the first
-                    # dimension (axis=0) running over the images. We take the
-                    # median over this axis. The first time through we put
-                    # this straight into the output Window.  afterwards we add
-                    # it in (with the appropriate weight)
+                    # We take the median over the last axis. The first time
+                    # through we put this straight into the output Window.
+                    # afterwards we add it in (with the appropriate weight)
+                    med = np.empty(wind.data.shape, np.float32)
+                    median(arr3ds[wnam], med)
                     if n == 0:
-                        wind.data = weight * np.median(arr3d, axis=0)
+                        wind.data = weight * med
                     else:
-                        wind.data += weight * np.median(arr3d, axis=0)
+                        wind.data += weight * med
 
             # Normalise the final result to a mean = 1.
             tccd /= wsum
@@ -1,5 +1,3 @@
-import sys
-import os
 import time
 
 import numpy as np
@@ -22,6 +20,63 @@ __all__ = [
 #
 ######################################
 
+# parameters registered by rtplot with their scope and visibility
+PARAMS = (
+    ("source", Cline.GLOBAL, Cline.HIDE),
+    ("device", Cline.LOCAL, Cline.HIDE),
+    ("width", Cline.LOCAL, Cline.HIDE),
+    ("height", Cline.LOCAL, Cline.HIDE),
+    ("run", Cline.GLOBAL, Cline.PROMPT),
+    ("first", Cline.LOCAL, Cline.PROMPT),
+    ("trim", Cline.GLOBAL, Cline.PROMPT),
+    ("ncol", Cline.GLOBAL, Cline.HIDE),
+    ("nrow", Cline.GLOBAL, Cline.HIDE),
+    ("twait", Cline.LOCAL, Cline.HIDE),
+    ("tmax", Cline.LOCAL, Cline.HIDE),
+    ("flist", Cline.LOCAL, Cline.PROMPT),
+    ("ccd", Cline.LOCAL, Cline.PROMPT),
+    ("nx", Cline.LOCAL, Cline.PROMPT),
+    ("pause", Cline.LOCAL, Cline.HIDE),
+    ("plotall", Cline.LOCAL, Cline.HIDE),
+    ("bias", Cline.GLOBAL, Cline.PROMPT),
+    ("lowlevel", Cline.GLOBAL, Cline.HIDE),
+    ("highlevel", Cline.GLOBAL, Cline.HIDE),
+    ("flat", Cline.GLOBAL, Cline.PROMPT),
+    ("defect", Cline.GLOBAL, Cline.PROMPT),
+    ("setup", Cline.GLOBAL, Cline.PROMPT),
+    ("drurl", Cline.GLOBAL, Cline.HIDE),
+    ("msub", Cline.GLOBAL, Cline.PROMPT),
+    ("iset", Cline.GLOBAL, Cline.PROMPT),
+    ("ilo", Cline.GLOBAL, Cline.PROMPT),
+    ("ihi", Cline.GLOBAL, Cline.PROMPT),
+    ("plo", Cline.GLOBAL, Cline.PROMPT),
+    ("phi", Cline.LOCAL, Cline.PROMPT),
+    ("xlo", Cline.GLOBAL, Cline.PROMPT),
+    ("xhi", Cline.GLOBAL, Cline.PROMPT),
+    ("ylo", Cline.GLOBAL, Cline.PROMPT),
+    ("yhi", Cline.GLOBAL, Cline.PROMPT),
+    ("profit", Cline.LOCAL, Cline.PROMPT),
+    ("fdevice", Cline.LOCAL, Cline.HIDE),
+    ("fwidth", Cline.LOCAL, Cline.HIDE),
+    ("fheight", Cline.LOCAL, Cline.HIDE),
+    ("method", Cline.LOCAL, Cline.HIDE),
+    ("beta", Cline.LOCAL, Cline.HIDE),
+    ("fwhm", Cline.LOCAL, Cline.HIDE),
+    ("fwhm_min", Cline.LOCAL, Cline.HIDE),
+    ("shbox", Cline.LOCAL, Cline.HIDE),
+    ("smooth", Cline.LOCAL, Cline.HIDE),
+    ("splot", Cline.LOCAL, Cline.HIDE),
+    ("fhbox", Cline.LOCAL, Cline.HIDE),
+    ("hmin", Cline.LOCAL, Cline.HIDE),
+    ("read", Cline.LOCAL, Cline.HIDE),
+    ("gain", Cline.LOCAL, Cline.HIDE),
+    ("thresh", Cline.LOCAL, Cline.HIDE),
+)
+
+# number of frames read ahead from lists of hcm files and the ULTRACAM
+# server, to keep the display going at the cost of the memory they occupy
+NPREFETCH = 4
+
 
 def rtplot(args=None):
     """``rtplot [source device width height] (run first [twait tmax] |
@@ -272,55 +327,8 @@ def rtplot(args=None):
     with Cline("HIPERCAM_ENV", ".hipercam", command, args) as cl:
 
         # register parameters
-        cl.register("source", Cline.GLOBAL, Cline.HIDE)
-        cl.register("device", Cline.LOCAL, Cline.HIDE)
-        cl.register("width", Cline.LOCAL, Cline.HIDE)
-        cl.register("height", Cline.LOCAL, Cline.HIDE)
-        cl.register("run", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("first", Cline.LOCAL, Cline.PROMPT)
-        cl.register("trim", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("ncol", Cline.GLOBAL, Cline.HIDE)
-        cl.register("nrow", Cline.GLOBAL, Cline.HIDE)
-        cl.register("twait", Cline.LOCAL, Cline.HIDE)
-        cl.register("tmax", Cline.LOCAL, Cline.HIDE)
-        cl.register("flist", Cline.LOCAL, Cline.PROMPT)
-        cl.register("ccd", Cline.LOCAL, Cline.PROMPT)
-        cl.register("nx", Cline.LOCAL, Cline.PROMPT)
-        cl.register("pause", Cline.LOCAL, Cline.HIDE)
-        cl.register("plotall", Cline.LOCAL, Cline.HIDE)
-        cl.register("bias", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("lowlevel", Cline.GLOBAL, Cline.HIDE)
-        cl.register("highlevel", Cline.GLOBAL, Cline.HIDE)
-        cl.register("flat", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("defect", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("setup", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("drurl", Cline.GLOBAL, Cline.HIDE)
-        cl.register("msub", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("iset", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("ilo", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("ihi", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("plo", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("phi", Cline.LOCAL, Cline.PROMPT)
-        cl.register("xlo", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("xhi", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("ylo", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("yhi", Cline.GLOBAL, Cline.PROMPT)
-        cl.register("profit", Cline.LOCAL, Cline.PROMPT)
-        cl.register("fdevice", Cline.LOCAL, Cline.HIDE)
-        cl.register("fwidth", Cline.LOCAL, Cline.HIDE)
-        cl.register("fheight", Cline.LOCAL, Cline.HIDE)
-        cl.register("method", Cline.LOCAL, Cline.HIDE)
-        cl.register("beta", Cline.LOCAL, Cline.HIDE)
-        cl.register("fwhm", Cline.LOCAL, Cline.HIDE)
-        cl.register("fwhm_min", Cline.LOCAL, Cline.HIDE)
-        cl.register("shbox", Cline.LOCAL, Cline.HIDE)
-        cl.register("smooth", Cline.LOCAL, Cline.HIDE)
-        cl.register("splot", Cline.LOCAL, Cline.HIDE)
-        cl.register("fhbox", Cline.LOCAL, Cline.HIDE)
-        cl.register("hmin", Cline.LOCAL, Cline.HIDE)
-        cl.register("read", Cline.LOCAL, Cline.HIDE)
-        cl.register("gain", Cline.LOCAL, Cline.HIDE)
-        cl.register("thresh", Cline.LOCAL, Cline.HIDE)
+        for name, scope, visibility in PARAMS:
+            cl.register(name, scope, visibility)
 
         # get inputs
         source = cl.get_value(
@@ -409,8 +417,9 @@ def rtplot(args=None):
             ignore="none",
         )
         if bias is not None:
-            # read the bias frame
+            # read the bias frame, in float32 to match the frames
             bias = hcam.MCCD.read(bias)
+            bias.float32()
             fprompt = "flat frame ['none' to ignore]"
         else:
             fprompt = "flat frame ['none' is normal choice with no bias]"
@@ -428,8 +437,9 @@ def rtplot(args=None):
             "flat", fprompt, cline.Fname("flat", hcam.HCAM), ignore="none"
         )
         if flat is not None:
-            # read the flat frame
+            # read the flat frame, in float32 to match the frames
             flat = hcam.MCCD.read(flat)
+            flat.float32()
 
         # defect file (if any)
         dfct = cl.get_value(
@@ -565,6 +575,9 @@ def rtplot(args=None):
     # slice up viewport
     pgsubp(nx, ny)
 
+    # the panel (ix, iy) for each CCD
+    panels = [(nc % nx + 1, nc // nx + 1) for nc in range(nccd)]
+
     # plot axes, labels, titles. Happens once only
     for cnam in ccds:
         pgsci(hcam.pgp.Params["axis.ci"])
@@ -579,12 +592,23 @@ def rtplot(args=None):
     fpos = []  # list of target positions to fit
     fframe = True  # waiting for first valid frame with profit
 
+    # radial grid scaled to the fit box for plotting the fitted profiles,
+    # plus the zero Y ordinates needed to compute them along the X axis.
+    # These are 2D, 1 row deep, as are the grids the profiles are compiled
+    # for during the fits, to avoid compiling them afresh while plotting.
+    rgrid = np.linspace(0, 1, 400).reshape(1, -1)
+    rzero = np.zeros_like(rgrid)
+
     # plot images
-    with spooler.data_source(source, resource, first, full=False) as spool:
+    with spooler.data_source(
+        source, resource, first, full=False, nprefetch=NPREFETCH
+    ) as spool:
 
-        # 'spool' is an iterable source of MCCDs
+        # 'spool' is an iterable source of MCCDs. Each one is read while
+        # the one before is being plotted, and lists of hcm files have
+        # further files read ahead of that.
         nframe = 0
-        for mccd in spool:
+        for mccd in spooler.prefetch(spool):
 
             if server_or_local:
                 # Handle the waiting game ...
@@ -719,23 +743,20 @@ def rtplot(args=None):
                     # this should be data as opposed to a blank frame
                     # between data frames that occur with nskip > 0
 
-                    # subtract the bias
-                    if bias is not None:
-                        ccd -= bias[cnam]
-
-                    # divide out the flat
-                    if flat is not None:
-                        ccd /= flat[cnam]
+                    # subtract the bias and divide out the flat
+                    if bias is not None or flat is not None:
+                        calibrate(
+                            ccd,
+                            None if bias is None else bias[cnam],
+                            None if flat is None else flat[cnam],
+                        )
 
                     if msub:
                         # subtract median from each window
-                        for wind in ccd.values():
-                            wind -= wind.median()
+                        subtract_medians(ccd)
 
                     # set to the correct panel and then plot CCD
-                    ix = (nc % nx) + 1
-                    iy = nc // nx + 1
-                    pgpanl(ix, iy)
+                    pgpanl(*panels[nc])
                     vmin, vmax = hcam.pgp.pCcd(
                         ccd,
                         iset,
@@ -831,10 +852,15 @@ def rtplot(args=None):
             if ccd.is_data():
 
                 # carry out fits. Nothing happens if fpos is empty
-                for fpar in fpos:
-                    # switch to the image plot
+                if fpos:
+                    # switch to the image plot. Each fit ends with the
+                    # image plot selected, so this is only needed once.
+                    # The search boxes, crosses and circles overlaid on it
+                    # are buffered and sent in one go once all are done.
                     imdev.select()
+                    pgbbuf()
 
+                for fpar in fpos:
                     # plot search box
                     if splot:
                         fpar.plot()
@@ -842,18 +868,19 @@ def rtplot(args=None):
                     try:
                         # extract search box from the CCD. 'fpar' is updated later
                         # if the fit is successful to reflect the new position
-                        swind = fpar.swind(ccd)
+                        wind = ccd[fpar.wnam]
+                        swind = wind.window(*fpar.region())
 
                         # carry out initial search
                         x, y, peak = swind.search(smooth, fpar.x, fpar.y, hmin, False)
 
                         # now for a more refined fit. First extract fit Window
-                        fwind = ccd[fpar.wnam].window(
-                            x - fhbox, x + fhbox, y - fhbox, y + fhbox
-                        )
+                        fwind = wind.window(x - fhbox, x + fhbox, y - fhbox, y + fhbox)
 
-                        # crude estimate of sky background
-                        sky = np.percentile(fwind.data, 50)
+                        # crude estimate of sky background from the median,
+                        # partition being quicker than a full sort
+                        k = fwind.data.size // 2
+                        sky = np.partition(fwind.data, k, axis=None)[k]
 
                         # refine the Aperture position by fitting the profile
                         (
@@ -880,7 +907,7 @@ def rtplot(args=None):
 
                         print("Targ {:d}: {:s}".format(fpar.ntarg, message))
 
-                        if peak > hmin and ccd[fpar.wnam].distance(x, y) > 1:
+                        if peak > hmin and wind.distance(x, y) > 1:
                             # update some initial parameters for next time
                             if method == "g":
                                 fpar.x, fpar.y, fpar.fwhm = x, y, fwhm
@@ -889,8 +916,10 @@ def rtplot(args=None):
 
                             # plot values versus radial distance
                             ok = sigma > 0
-                            R = np.sqrt((X - x) ** 2 + (Y - y) ** 2)
+                            R = np.hypot(X - x, Y - y)
+                            # the fit plot is buffered and sent in one go
                             fdev.select()
+                            pgbbuf()
                             vmin = min(sky, sky + height, fwind.min())
                             vmax = max(sky, sky + height, fwind.max())
                             extent = vmax - vmin
@@ -911,14 +940,19 @@ def rtplot(args=None):
 
                             # line fit
                             pgsci(3)
-                            r = np.linspace(0, R.max(), 400)
+                            # the compiled profiles from the fits, evaluated
+                            # along the X axis about a centre at the origin
+                            r = R.max() * rgrid
                             if method == "g":
-                                alpha = 4 * np.log(2.0) / fwhm ** 2
-                                f = sky + height * np.exp(-alpha * r ** 2)
+                                f = hcam.fitting.gaussian(
+                                    r, rzero, sky, height, 0.0, 0.0, fwhm, 1, 1, 0
+                                )
                             elif method == "m":
-                                alpha = 4 * (2 ** (1 / beta) - 1) / fwhm ** 2
-                                f = sky + height / (1 + alpha * r ** 2) ** beta
-                            pgline(r, f)
+                                f = hcam.fitting.moffat(
+                                    r, rzero, sky, height, 0.0, 0.0, fwhm, beta, 1, 1, 0
+                                )
+                            pgline(r[0], f[0])
+                            pgebuf()
 
                             # back to the image to plot a circle of radius FWHM
                             imdev.select()
@@ -942,6 +976,9 @@ def rtplot(args=None):
                         )
                         pgsci(2)
 
+                if fpos:
+                    pgebuf()
+
             if pause > 0.0:
                 # pause between frames
                 time.sleep(pause)
@@ -953,9 +990,47 @@ def rtplot(args=None):
 # From here is support code not visible outside
 
 
+def calibrate(ccd, bccd, fccd):
+    """Subtracts the bias :class:`CCD` `bccd` from the :class:`CCD` `ccd` and
+    divides by the flat `fccd`, either of which can be None to skip it. This
+    is done window by window so that each window is still in cache for the
+    division after the subtraction. As with 'ccd -= bccd' and 'ccd /= fccd',
+    windows of `ccd` missing from `bccd` or `fccd` are left untouched.
+    """
+    for wnam, wind in ccd.items():
+        if bccd is not None and wnam in bccd:
+            wind -= bccd[wnam]
+        if fccd is not None and wnam in fccd:
+            wind /= fccd[wnam]
+
+
+def subtract_medians(ccd):
+    """Subtracts the median from each Window of the :class:`CCD` `ccd`. Windows
+    of the same shape have their medians computed together in one call to
+    save on the overheads of many small medians, e.g. the many windows of
+    drift mode.
+    """
+    # group the windows by shape
+    groups = {}
+    for wind in ccd.values():
+        groups.setdefault(wind.data.shape, []).append(wind)
+
+    for winds in groups.values():
+        if len(winds) == 1:
+            winds[0] -= winds[0].median()
+        else:
+            # the stack is a copy, so can be partitioned in place
+            stack = np.stack([wind.data for wind in winds])
+            meds = np.median(
+                stack.reshape(len(winds), -1), axis=1, overwrite_input=True
+            )
+            for wind, med in zip(winds, meds):
+                wind -= med
+
+
 class Fpar:
     """Class for profile fits. Able to plot the search box around an x,y
-    position and come up with a Window representing that region."""
+    position and return the region it covers."""
 
     def __init__(self, x, y, wnam, ntarg, shbox, fwhm, beta):
         self.x = x
@@ -980,8 +1055,3 @@ class Fpar:
         xlo, xhi, ylo, yhi = self.region()
         pgrect(xlo, xhi, ylo, yhi)
         pgptxt(xlo, ylo, 0, 1.3, str(self.ntarg))
-
-    def swind(self, ccd):
-        """Returns with search Window"""
-        xlo, xhi, ylo, yhi = self.region()
-        return ccd[self.wnam].window(xlo, xhi, ylo, yhi)
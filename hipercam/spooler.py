@@ -17,10 +17,17 @@ interested in accessing data in a specific manner.
 
 """
 
+import functools
+import io
+import os
+import threading
 import time
 from abc import ABC, abstractmethod
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
+import requests
 from astropy.io import fits
 from . import ccd
 from . import ucam
@@ -37,6 +44,7 @@ __all__ = (
     "HcamListSpool",
     "get_ccd_pars",
     "hang_about",
+    "prefetch",
     "HcamServSpool",
     "HcamDiskSpool",
     "UcamTbytesSpool",
@@ -50,16 +58,21 @@ def rhcam(fname):
 
     Argument::
 
-       fname : (string)
+       fname : (string | bytes | file-like object)
 
           Name of file. This should be a FITS file with a particular
           arrangement of HDUs. The keyword HIPERCAM should be present in the
           primary HDU's header and set to either CCD for single 'CCD' data or
           'MCCD' for multiple CCDs. A ValueError will be raised if this is not
-          the case. See the docs on CCD and MCCD for more.
+          the case. See the docs on CCD and MCCD for more. The contents of
+          such a file already held in memory, e.g. after fetching it over a
+          network, can be passed as bytes or an open file-like object instead.
 
     """
 
+    if isinstance(fname, bytes):
+        fname = io.BytesIO(fname)
+
     # Read HDU list
     with fits.open(fname) as hdul:
         htype = hdul[0].header["HIPERCAM"]
@@ -69,7 +82,7 @@ def rhcam(fname):
             return ccd.MCCD.rhdul(hdul)
         else:
             raise ValueError(
-                'Could not find keyword "HIPERCAM" in primary header of file = {:s}'.format(
+                'Could not find keyword "HIPERCAM" in primary header of file = {}'.format(
                     fname
                 )
             )
@@ -99,7 +112,32 @@ class SpoolerBase(ABC):
         pass
 
 
-class UcamDiskSpool(SpoolerBase):
+class _RawSpool(SpoolerBase):
+
+    """Base for spoolers that wrap one of the raw data readers of :mod:`ucam`
+    or :mod:`hcam`, held as `_iter`. Iteration is handed straight to the
+    reader to avoid an extra call per frame. Frames can also be accessed by
+    number, e.g. ``spool[10]``, with numbers starting from 1. As the readers
+    locate frames from their fixed size, this costs a single seek. Iteration
+    continues from the frame after the last one accessed.
+    """
+
+    def __exit__(self, *args):
+        self._iter.__exit__(args)
+
+    def __iter__(self):
+        return self._iter
+
+    def __next__(self):
+        return self._iter.__next__()
+
+    def __getitem__(self, nframe):
+        if nframe < 1:
+            raise IndexError("frame numbers start from 1")
+        return self._iter(nframe)
+
+
+class UcamDiskSpool(_RawSpool):
 
     """Provides an iterable context manager to loop through frames within
     a raw ULTRACAM or ULTRASPEC disk file.
@@ -120,20 +158,14 @@ class UcamDiskSpool(SpoolerBase):
         """
         self._iter = ucam.Rdata(run, first, False)
 
-    def __exit__(self, *args):
-        self._iter.__exit__(args)
-
-    def __next__(self):
-        return self._iter.__next__()
 
-
-class UcamServSpool(SpoolerBase):
+class UcamServSpool(_RawSpool):
 
     """Provides an iterable context manager to loop through frames within
     a raw ULTRACAM or ULTRASPEC raw file served from the ATC FileServer
     """
 
-    def __init__(self, run, first=1):
+    def __init__(self, run, first=1, nprefetch=0):
         """Attaches the UcamDiskSpool to a run.
 
         Arguments::
@@ -145,21 +177,15 @@ class UcamServSpool(SpoolerBase):
            first : (int)
               The first frame to access.
 
-           flt : (bool)
-              If True, a conversion to 4-byte floats on input will be attempted
-              if the data are of integer form.
+           nprefetch : (int)
+              Number of frames to request ahead of need, 0 (default) for
+              none. Ignored if first == 0 (always the last frame).
 
         """
-        self._iter = ucam.Rdata(run, first, True)
+        self._iter = ucam.Rdata(run, first, True, nprefetch=nprefetch)
 
-    def __exit__(self, *args):
-        self._iter.__exit__(args)
 
-    def __next__(self):
-        return self._iter.__next__()
-
-
-class UcamTbytesSpool(SpoolerBase):
+class UcamTbytesSpool(_RawSpool):
 
     """Provides an iterable context manager to loop through frames within
     a raw ULTRACAM or ULTRASPEC disk file returning the timing bytes.
@@ -186,14 +212,8 @@ class UcamTbytesSpool(SpoolerBase):
         """Need this to pass to utimer in "tbytes"."""
         return self._iter
 
-    def __exit__(self, *args):
-        self._iter.__exit__(args)
-
-    def __next__(self):
-        return self._iter.__next__()
 
-
-class HcamDiskSpool(SpoolerBase):
+class HcamDiskSpool(_RawSpool):
 
     """Provides an iterable context manager to loop through frames within
     a raw HiPERCAM file.
@@ -214,12 +234,6 @@ class HcamDiskSpool(SpoolerBase):
         """
         self._iter = hcam.Rdata(run, first, False, full)
 
-    def __exit__(self, *args):
-        self._iter.__exit__(args)
-
-    def __next__(self):
-        return self._iter.__next__()
-
 
 class HcamListSpool(SpoolerBase):
 
@@ -239,9 +253,12 @@ class HcamListSpool(SpoolerBase):
                 ...
 
     to get :class:`CCD` objects.
+
+    Optionally, files can be read ahead of need in a pool of background
+    threads so that reading overlaps with whatever is done with each frame.
     """
 
-    def __init__(self, lname, cnam=None):
+    def __init__(self, lname, cnam=None, nprefetch=0, cache_size=0):
         """Attaches the :class:`HcamListSpool` to a list of files
 
         Arguments::
@@ -249,55 +266,121 @@ class HcamListSpool(SpoolerBase):
            lname : string or list
               Name of a file list of HiPERCAM files, or a Python list of file
               names (more generally any iterable array of names). Blank
-              entries or any starting with '#' are ignored.
+              entries or any starting with '#' are ignored. Names starting
+              with http:// or https:// are fetched over the network as
+              given, without adding the '.hcm' extension. A
+              :class:`HipercamError` is raised if the server takes longer
+              than URL_TIMEOUT seconds to respond.
 
            cnam  : string or None
               CCD label if you want to return individual CCDs rather than
               MCCDs. This is used in 'combine' to save memory.
+
+           nprefetch : int
+              Maximum number of files to read ahead of need, 0 (default) for
+              none. Each one held costs the memory of a full frame, so this
+              should be kept small.
+
+           cache_size : int
+              If > 0, frames read are kept in a cache shared by all
+              :class:`HcamListSpool` objects, so that a second pass over the
+              same files, normally made with a new spool, need not go back
+              to disk. Each frame this spool adds trims the cache to its
+              `cache_size` most recently used frames. Frames are re-read if
+              their file has been modified since. Copies are returned, so
+              the cached frames are not changed by whatever is done with
+              them. Each frame held costs the memory of a full frame, so set
+              this no larger than needed. The cache can be inspected and
+              emptied with :meth:`cache_info` and :meth:`cache_clear`.
+              Frames fetched over the network are never cached.
         """
+        # strip and filter the names once up front
         if isinstance(lname, str):
-            self._iter = open(lname)
-            self._file = True
+            self._files = _list_file(lname, os.path.getmtime(lname))
         else:
-            self._iter = lname
-            self._file = False
+            self._files = _clean_names(lname)
+        self._iter = iter(self._files)
 
         self.cnam = cnam
+        self.cache_size = cache_size
+        self.nprefetch = nprefetch
+        if nprefetch > 0:
+            self._executor = ThreadPoolExecutor(nprefetch)
+        else:
+            self._executor = None
+        self._jobs = deque()
 
     def __exit__(self, *args):
-        if self._file:
-            # close in the case of file lists
-            self._iter.close()
+        if self._executor is not None:
+            # abandon any reads not yet started and wait for the rest
+            for job in self._jobs:
+                job.cancel()
+            self._executor.shutdown()
 
     def __next__(self):
-        # returns next image from a list. adds in the file name
-        # as a header parameter
-        if self._file:
-            for fname in self._iter:
-                if not fname.startswith("#") and not fname.isspace():
-                    break
-            else:
+        if self._executor is None:
+            fname = self._next_name()
+            if fname is None:
                 raise StopIteration
-
+            return self._read(fname)
+
+        # keep the queue of reads topped up
+        while len(self._jobs) < self.nprefetch:
+            fname = self._next_name()
+            if fname is None:
+                break
+            self._jobs.append(self._executor.submit(self._read, fname))
+
+        if len(self._jobs) == 0:
+            raise StopIteration
+
+        return self._jobs.popleft().result()
+
+    def _next_name(self):
+        # returns next file name from the list, None at the end
+        return next(self._iter, None)
+
+    @staticmethod
+    def cache_info():
+        """Returns (hits, misses, currsize) of the frame cache shared by all
+        :class:`HcamListSpool` objects"""
+        return _FRAME_CACHE.info()
+
+    @staticmethod
+    def cache_clear():
+        """Empties the frame cache and resets its counts of hits and misses"""
+        _FRAME_CACHE.clear()
+
+    def _read(self, fname):
+        # reads an image, adding in the file name as a header parameter
+        if fname.startswith(("http://", "https://")):
+            # URLs are used as given and never cached as there is no
+            # modification time to tell if what they point at has changed
+            frame = self._load(_fetch(fname))
         else:
-            try:
-                fname = self._iter.pop(0)
-            except IndexError:
-                raise StopIteration
+            source = utils.add_extension(fname, core.HCAM)
+            if self.cache_size > 0:
+                frame = _FRAME_CACHE.get(
+                    (source, self.cnam),
+                    _mtime(source),
+                    self.cache_size,
+                    self._load,
+                    source,
+                )
+            else:
+                frame = self._load(source)
+        frame.head["FILENAME"] = fname
+        return frame
 
+    def _load(self, source):
+        # loads an MCCD, or a CCD if cnam is set
         if self.cnam is None:
-            mccd = ccd.MCCD.read(utils.add_extension(fname.strip(), core.HCAM))
-            mccd.head["FILENAME"] = fname.strip()
-            return mccd
+            return ccd.MCCD.read(source)
         else:
-            ccd1 = ccd.CCD.read(
-                utils.add_extension(fname.strip(), core.HCAM), self.cnam
-            )
-            ccd1.head["FILENAME"] = fname.strip()
-            return ccd1
+            return ccd.CCD.read(source, self.cnam)
 
 
-class HcamServSpool(SpoolerBase):
+class HcamServSpool(_RawSpool):
 
     """Provides an iterable context manager to loop through frames within
     a raw HiPERCAM file served from Stu's FileServer
@@ -318,14 +401,8 @@ class HcamServSpool(SpoolerBase):
         """
         self._iter = hcam.Rdata(run, first, True)
 
-    def __exit__(self, *args):
-        self._iter.__exit__(args)
 
-    def __next__(self):
-        return self._iter.__next__()
-
-
-class HcamTbytesSpool(SpoolerBase):
+class HcamTbytesSpool(_RawSpool):
 
     """Provides an iterable context manager to loop through frames within
     a raw HiPERCAM file returning the timing bytes
@@ -347,12 +424,6 @@ class HcamTbytesSpool(SpoolerBase):
         self._iter = hcam.Rtbytes(run, first, False)
         self.ntbytes = self._iter.ntbytes
 
-    def __exit__(self, *args):
-        self._iter.__exit__(args)
-
-    def __next__(self):
-        return self._iter.__next__()
-
 
 def data_source(source, resource, first=1, **kwargs):
     """Returns a context manager needed to run through a set of exposures.
@@ -382,7 +453,8 @@ def data_source(source, resource, first=1, **kwargs):
 
        kwargs : dictionary of keyword arguments
           some of the spooler classes support extra arguments. e.g. HcamDiskSpool.
-          These are passed via kwargs
+          These are passed via kwargs. Any not taken by the spooler for
+          `source` are ignored.
 
     Returns::
 
@@ -397,18 +469,28 @@ def data_source(source, resource, first=1, **kwargs):
        how to handle this.
     """
 
-    if source == "us":
-        return UcamServSpool(resource, first)
-    elif source == "ul":
-        return UcamDiskSpool(resource, first)
-    elif source == "hs":
-        return HcamServSpool(resource, first)
-    elif source == "hl":
-        return HcamDiskSpool(resource, first, **kwargs)
-    elif source == "hf":
-        return HcamListSpool(resource)
-    else:
-        raise ValueError("{!s} is not a recognised data source".format(source))
+    try:
+        spool, keys = _SPOOLERS[source]
+    except KeyError:
+        raise ValueError(
+            "{!s} is not a recognised data source".format(source)
+        ) from None
+
+    # pass on just the arguments the spooler takes
+    kwargs["first"] = first
+    kwargs = {key: value for key, value in kwargs.items() if key in keys}
+    return spool(resource, **kwargs)
+
+
+# spooler class for each data source option and the keyword arguments it
+# takes, used by data_source.
+_SPOOLERS = {
+    "us": (UcamServSpool, ("first", "nprefetch")),
+    "ul": (UcamDiskSpool, ("first",)),
+    "hs": (HcamServSpool, ("first",)),
+    "hl": (HcamDiskSpool, ("first", "full")),
+    "hf": (HcamListSpool, ("cnam", "nprefetch", "cache_size")),
+}
 
 
 def get_ccd_pars(source, resource):
@@ -427,26 +509,29 @@ def get_ccd_pars(source, resource):
 
     Returns with a list of tuples with the information outlined above. In the
     case of file lists these are extracted from the first file of the list only.
+    Results are cached, so the mapping returned is read-only.
 
     """
+    # the modification time of a file list is included so that any edit of
+    # the list is picked up
+    mtime = os.path.getmtime(resource) if source == "hf" else None
+    return _get_ccd_pars(source, resource, mtime)
+
 
+@functools.lru_cache(maxsize=32)
+def _get_ccd_pars(source, resource, mtime):
+    # does the work for get_ccd_pars
     if source.startswith("u"):
         server = source.endswith("s")
         # ULTRA(CAM|SPEC)
         rhead = ucam.Rhead(resource, server=server)
         if rhead.instrument == "ULTRACAM":
             # ULTRACAM raw data file: fixed data
-            return OrderedDict(
-                (
-                    ("1", (1080, 1032, 56, 8)),
-                    ("2", (1080, 1032, 56, 8)),
-                    ("3", (1080, 1032, 56, 8)),
-                )
-            )
+            return _ULTRACAM_PARS
 
         elif rhead.instrument == "ULTRASPEC":
             # ULTRASPEC raw data file: fixed data
-            return OrderedDict((("1", (1056, 1072, 0, 0)),))
+            return _ULTRASPEC_PARS
 
         else:
             raise ValueError("instrument = {:s} not supported".format(rhead.instrument))
@@ -456,67 +541,55 @@ def get_ccd_pars(source, resource):
             # file list: we access the first file of the list to read the key
             # and dimension info on the assumption that it is the same, for
             # all files.
-            with open(resource) as flp:
-                for fname in flp:
-                    if not fname.startswith("#") and not fname.isspace():
-                        break
-                else:
-                    raise ValueError(
-                        "failed to find any file names in {:s}".format(resource)
-                    )
-            return ccd.get_ccd_info(utils.add_extension(fname.strip(), core.HCAM))
+            fnames = _list_file(resource, mtime)
+            if len(fnames) == 0:
+                raise ValueError(
+                    "failed to find any file names in {:s}".format(resource)
+                )
+            return MappingProxyType(
+                ccd.get_ccd_info(utils.add_extension(fnames[0], core.HCAM))
+            )
 
         else:
             # HiPERCAM raw data file: fixed data
-            return OrderedDict(
-                (
-                    (
-                        "1",
-                        (
-                            hcam.HCM_NXTOT,
-                            hcam.HCM_NYTOT,
-                            hcam.HCM_NPSCAN,
-                            hcam.HCM_NOSCAN,
-                        ),
-                    ),
-                    (
-                        "2",
-                        (
-                            hcam.HCM_NXTOT,
-                            hcam.HCM_NYTOT,
-                            hcam.HCM_NPSCAN,
-                            hcam.HCM_NOSCAN,
-                        ),
-                    ),
-                    (
-                        "3",
-                        (
-                            hcam.HCM_NXTOT,
-                            hcam.HCM_NYTOT,
-                            hcam.HCM_NPSCAN,
-                            hcam.HCM_NOSCAN,
-                        ),
-                    ),
-                    (
-                        "4",
-                        (
-                            hcam.HCM_NXTOT,
-                            hcam.HCM_NYTOT,
-                            hcam.HCM_NPSCAN,
-                            hcam.HCM_NOSCAN,
-                        ),
-                    ),
-                    (
-                        "5",
-                        (
-                            hcam.HCM_NXTOT,
-                            hcam.HCM_NYTOT,
-                            hcam.HCM_NPSCAN,
-                            hcam.HCM_NOSCAN,
-                        ),
-                    ),
-                )
-            )
+            return _HIPERCAM_PARS
+
+
+@functools.lru_cache(maxsize=32)
+def _list_file(lname, mtime):
+    # returns the file names from a file list. The modification time is
+    # passed to stop a stale copy being returned from the cache once the
+    # list has been edited. Shared by get_ccd_pars and HcamListSpool so that
+    # the list is only read once.
+    with open(lname) as fin:
+        return _clean_names(fin)
+
+
+def _clean_names(fnames):
+    # strips file names and removes blank and comment entries. List
+    # comprehensions and an index test keep this quick for long lists.
+    fnames = [fname.strip() for fname in fnames]
+    return tuple([fname for fname in fnames if fname and fname[0] != "#"])
+
+
+# fixed CCD labels, maximum dimensions and padding of the raw data formats
+# returned by get_ccd_pars. Read-only since they are shared.
+_ULTRACAM_PARS = MappingProxyType(
+    {
+        "1": (1080, 1032, 56, 8),
+        "2": (1080, 1032, 56, 8),
+        "3": (1080, 1032, 56, 8),
+    }
+)
+
+_ULTRASPEC_PARS = MappingProxyType({"1": (1056, 1072, 0, 0)})
+
+_HIPERCAM_PARS = MappingProxyType(
+    {
+        cnam: (hcam.HCM_NXTOT, hcam.HCM_NYTOT, hcam.HCM_NPSCAN, hcam.HCM_NOSCAN)
+        for cnam in ("1", "2", "3", "4", "5")
+    }
+)
 
 
 def hang_about(obj, twait, tmax, total_time):
@@ -589,3 +662,115 @@ def hang_about(obj, twait, tmax, total_time):
         give_up, try_again = False, False
 
     return (give_up, try_again, total_time)
+
+
+def prefetch(spool):
+    """Generator which yields the same objects as the iterable `spool`, but
+    reads each one in a background thread while the previous one is being
+    dealt with, so that reading overlaps with processing. e.g.::
+
+       with spooler.data_source(source, resource, first) as spool:
+           for mccd in spooler.prefetch(spool):
+               ...
+
+    If `spool` returns None to indicate that there is no new frame yet (see
+    :func:`hang_about`), the next read is not started until the consumer
+    asks for it, so that any wait in between is not undermined by a
+    frame read before it. Exceptions raised while reading are re-raised in
+    the consumer.
+    """
+    with ThreadPoolExecutor(1) as executor:
+        spool = iter(spool)
+        job = executor.submit(next, spool, _END)
+        while True:
+            obj = job.result()
+            if obj is _END:
+                break
+            elif obj is None:
+                yield obj
+                job = executor.submit(next, spool, _END)
+            else:
+                job = executor.submit(next, spool, _END)
+                yield obj
+
+
+# marks the end of iteration in prefetch
+_END = object()
+
+
+class _FrameCache:
+    """Least-recently-used store of the frames read by :class:`HcamListSpool`
+    objects when caching is on. It is shared between spools since each pass
+    through a list is normally made with a new one. Strong references are
+    held, as weak ones would be dropped as soon as the frame is finished
+    with, before any second pass. It is safe to use from the reading
+    threads.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, mtime, maxsize, load, *args):
+        """Returns a copy of the frame stored under key, calling load(*args) to
+        create it if it is not there or if it was stored with a modification
+        time other than mtime. A frame that is added trims the cache to the
+        maxsize most recently used."""
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                frame = entry[1]
+            else:
+                self.misses += 1
+                frame = None
+
+        if frame is None:
+            frame = load(*args)
+            with self._lock:
+                self._frames[key] = (mtime, frame)
+                self._frames.move_to_end(key)
+                while len(self._frames) > maxsize:
+                    self._frames.popitem(last=False)
+
+        return frame.copy()
+
+    def info(self):
+        with self._lock:
+            return (self.hits, self.misses, len(self._frames))
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_FRAME_CACHE = _FrameCache()
+
+
+# seconds to wait for a server to respond to a request for a file
+URL_TIMEOUT = 10.0
+
+
+def _fetch(url):
+    # fetches a file straight into memory rather than staging it to disk
+    try:
+        resp = requests.get(url, timeout=URL_TIMEOUT)
+    except requests.exceptions.Timeout as err:
+        raise core.HipercamError(
+            "no response within {:.1f} seconds from {:s}".format(URL_TIMEOUT, url)
+        ) from err
+    resp.raise_for_status()
+    return io.BytesIO(resp.content)
+
+
+def _mtime(fname):
+    # modification time of a file, None if it cannot be found
+    try:
+        return os.path.getmtime(fname)
+    except OSError:
+        return None
@@ -0,0 +1,173 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Code for stacking images and taking medians over the stack, as used when
+combining frames in scripts such as 'combine' and 'makeflat'.
+"""
+
+from numba import jit
+import numpy as np
+
+try:
+    # optional: faster than numpy for medians over short axes
+    import bottleneck as bn
+except ImportError:
+    bn = None
+
+__all__ = ("stack_buffers", "median", "approx_median", "binapprox")
+
+
+def stack_buffers(stacks, ccd, nimage):
+    """Returns a dictionary keyed by window label of 3D buffers in which to stack
+    `nimage` images of each window of the :class:`CCD` `ccd`. The images run
+    along the last axis so that the values of any one pixel are contiguous in
+    memory. The buffers are float32 whatever the type of the input, as this
+    is precise enough for calibrated data and halves the memory compared to
+    float64.
+
+    `stacks` is a pool of buffers from earlier calls, a dictionary of lists
+    of buffers keyed by shape, which are re-used where possible. Any new
+    buffers needed are added to it. Each window gets a distinct buffer.
+    """
+    arr3ds, nused = {}, {}
+    for wnam, wind in ccd.items():
+        shape = wind.data.shape + (nimage,)
+        pool = stacks.setdefault(shape, [])
+        nuse = nused.get(shape, 0)
+        if nuse == len(pool):
+            pool.append(np.empty(shape, np.float32))
+        arr3ds[wnam] = pool[nuse]
+        nused[shape] = nuse + 1
+    return arr3ds
+
+
+def contiguous(arr3d):
+    """Returns `arr3d` if it is C-contiguous and writeable, else a copy which is.
+    The medians are fastest with the values of each pixel adjacent in memory,
+    and are computed in place which needs write access.
+    """
+    if arr3d.flags.c_contiguous and arr3d.flags.writeable:
+        return arr3d
+    else:
+        return np.array(arr3d, order="C")
+
+
+# bottleneck beats numpy's introselect for medians over this many
+# images or fewer, but loses out for larger numbers.
+BN_NMAX = 64
+
+
+def median(arr3d, out):
+    """Computes the median of a 3D stack of images over its last axis, storing
+    the result in `out`, a 2D array matching the first two dimensions of
+    `arr3d`. `arr3d` may be scrambled in the process. NaNs are ignored, but
+    the slower NaN-aware median is only used if there are any.
+    """
+    n = arr3d.shape[-1]
+    if n == 1:
+        out[...] = arr3d[..., 0]
+        return
+    elif np.isnan(arr3d).any():
+        np.nanmedian(arr3d, axis=-1, overwrite_input=True, out=out)
+        return
+    elif n == 2:
+        np.add(arr3d[..., 0], arr3d[..., 1], out=out)
+        out *= 0.5
+        return
+
+    arr3d = contiguous(arr3d)
+    if bn is not None and n <= BN_NMAX:
+        out[...] = bn.median(arr3d, axis=-1)
+    else:
+        # partition in place along the contiguous last axis, which saves
+        # the axis juggling and copying within np.median
+        k = n // 2
+        if n % 2:
+            arr3d.partition(k, axis=-1)
+            out[...] = arr3d[..., k]
+        else:
+            arr3d.partition((k - 1, k), axis=-1)
+            np.add(arr3d[..., k - 1], arr3d[..., k], out=out)
+            out *= 0.5
+
+
+# binapprox is only used for more than BA_NMIN images as it gains nothing
+# over the exact median for small numbers. BA_NBIN is the number of bins
+# it uses.
+BA_NMIN = 20
+BA_NBIN = 1000
+
+
+def approx_median(arr3d, out):
+    """Computes an approximate median of a 3D stack of images over its last
+    axis using :func:`binapprox`, storing the result in `out`, a 2D array
+    matching the first two dimensions of `arr3d`. Falls back to
+    :func:`median` if there are any NaNs.
+    """
+    if np.isnan(arr3d).any():
+        median(arr3d, out)
+    else:
+        binapprox(contiguous(arr3d), out, BA_NBIN)
+
+
+@jit(nopython=True, nogil=True, cache=True)
+def binapprox(arr3d, out, nbin):
+    """Computes an approximation to the median of a 3D stack of images over its
+    last axis, storing the result in `out`, a 2D array matching the first two
+    dimensions of `arr3d`. This is the "binapprox" algorithm of Tibshirani
+    (2008): the values of each pixel within +/- 1 RMS of their mean are
+    counted into `nbin` bins and the centre of the bin containing the median
+    is returned. For even numbers of images the centres of the bins holding
+    the two middle values are averaged. Since the median always lies within
+    1 RMS of the mean, the error is of order RMS/nbin.
+    """
+    ny, nx, n = arr3d.shape
+    counts = np.empty(nbin, np.int64)
+    k = (n + 1) // 2
+
+    for iy in range(ny):
+        for ix in range(nx):
+            vals = arr3d[iy, ix]
+
+            # mean and RMS
+            total = 0.0
+            for val in vals:
+                total += val
+            mean = total / n
+            total = 0.0
+            for val in vals:
+                total += (val - mean) ** 2
+            rms = np.sqrt(total / n)
+
+            if rms == 0.0:
+                out[iy, ix] = mean
+                continue
+
+            # count the values below the bins and in each bin
+            lo = mean - rms
+            scale = nbin / (2 * rms)
+            counts[:] = 0
+            nbelow = 0
+            for val in vals:
+                if val < lo:
+                    nbelow += 1
+                else:
+                    ibin = int((val - lo) * scale)
+                    if ibin < nbin:
+                        counts[ibin] += 1
+
+            # find the bin containing the k-th value
+            ncum = nbelow
+            for ibin in range(nbin):
+                ncum += counts[ibin]
+                if ncum >= k:
+                    break
+            centre = lo + (ibin + 0.5) / scale
+
+            if n % 2 == 0:
+                # even n: average with the bin containing the (k+1)-th value
+                while ncum < k + 1 and ibin < nbin - 1:
+                    ibin += 1
+                    ncum += counts[ibin]
+                centre = (centre + lo + (ibin + 0.5) / scale) / 2
+
+            out[iy, ix] = centre
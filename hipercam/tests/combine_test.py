@@ -0,0 +1,124 @@
+import unittest
+import warnings
+
+import numpy as np
+
+from hipercam import stack
+
+
+class TestMedian(unittest.TestCase):
+    """Provides tests of the median kernels used by combine and makeflat
+    against numpy.
+
+    """
+
+    def setUp(self):
+        self.rng = np.random.default_rng(5)
+
+    def make(self, n):
+        return self.rng.normal(100.0, 10.0, (7, 5, n)).astype(np.float32)
+
+    def check(self, arr3d, func=None):
+        # compares against np.median applied to an untouched copy
+        expected = np.median(arr3d.astype(np.float64), axis=-1)
+        out = np.empty(arr3d.shape[:2], np.float32)
+        (func or stack.median)(arr3d.copy(), out)
+        self.assertTrue(np.allclose(out, expected, rtol=1e-6, atol=0))
+
+    def test_one(self):
+        self.check(self.make(1))
+
+    def test_two(self):
+        self.check(self.make(2))
+
+    def test_odd_even(self):
+        for n in (3, 4, 11, 12):
+            self.check(self.make(n))
+
+    def test_bottleneck_limit(self):
+        for n in (stack.BN_NMAX, stack.BN_NMAX + 1):
+            self.check(self.make(n))
+
+    def test_partition(self):
+        # the in-place partition used when bottleneck is not installed
+        bn = stack.bn
+        stack.bn = None
+        try:
+            for n in (3, 4, stack.BN_NMAX, stack.BN_NMAX + 1):
+                self.check(self.make(n))
+        finally:
+            stack.bn = bn
+
+    def test_not_contiguous(self):
+        arr3d = np.moveaxis(self.make(9), -1, 0).copy()
+        self.check(np.moveaxis(arr3d, 0, -1))
+
+    def test_nans(self):
+        for n in (1, 2, 5, 6, stack.BN_NMAX + 1):
+            arr3d = self.make(n)
+            arr3d[0, 0, 0] = np.nan
+            arr3d[1, 2, :] = np.nan
+            out = np.empty(arr3d.shape[:2], np.float32)
+            with warnings.catch_warnings():
+                # all-NaN pixel
+                warnings.simplefilter("ignore", RuntimeWarning)
+                stack.median(arr3d.copy(), out)
+                expected = np.nanmedian(arr3d, axis=-1)
+            if n == 1:
+                # a single image is just copied, NaNs and all
+                expected = arr3d[..., 0]
+            self.assertTrue(
+                np.allclose(out, expected, rtol=1e-6, atol=0, equal_nan=True)
+            )
+
+
+class TestApproxMedian(unittest.TestCase):
+    """Provides tests of the binapprox approximation to the median.
+
+    """
+
+    def setUp(self):
+        self.rng = np.random.default_rng(7)
+
+    def check(self, n, nbin):
+        arr3d = self.rng.normal(100.0, 10.0, (6, 4, n)).astype(np.float32)
+        out = np.empty(arr3d.shape[:2], np.float32)
+        stack.binapprox(arr3d, out, nbin)
+
+        # the answer should be within a bin width of the exact median
+        expected = np.median(arr3d.astype(np.float64), axis=-1)
+        width = 2 * arr3d.std(axis=-1, dtype=np.float64) / nbin
+        self.assertTrue((np.abs(out - expected) <= width * 1.001).all())
+
+    def test_tolerance(self):
+        for n in (21, 24, 40, 101):
+            for nbin in (10, 1000):
+                self.check(n, nbin)
+
+    def test_even_unbiased(self):
+        # the two middle values are averaged, so there is no systematic
+        # offset from the exact median for even n
+        arr3d = self.rng.normal(100.0, 5.0, (40, 40, 24)).astype(np.float32)
+        out = np.empty(arr3d.shape[:2], np.float32)
+        stack.binapprox(arr3d, out, stack.BA_NBIN)
+        diff = out - np.median(arr3d.astype(np.float64), axis=-1)
+        self.assertLess(abs(diff.mean()), 0.01)
+
+    def test_constant(self):
+        arr3d = np.full((3, 2, 25), 4.5, np.float32)
+        out = np.empty((3, 2), np.float32)
+        stack.binapprox(arr3d, out, stack.BA_NBIN)
+        self.assertTrue((out == 4.5).all())
+
+    def test_nans(self):
+        # approx_median falls back to the exact median when there are NaNs
+        arr3d = self.rng.normal(0.0, 1.0, (4, 3, 31)).astype(np.float32)
+        arr3d[2, 1, 4] = np.nan
+        out = np.empty((4, 3), np.float32)
+        stack.approx_median(arr3d.copy(), out)
+        expected = np.nanmedian(arr3d, axis=-1)
+        self.assertTrue(np.allclose(out, expected, rtol=1e-6, atol=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
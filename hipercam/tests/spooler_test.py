@@ -0,0 +1,205 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import requests
+
+from hipercam import Group, Header, Winhead, Window, CCD, MCCD, HipercamError, spooler
+
+
+def fake_mccd(level):
+    # builds a small MCCD with all pixels set to 'level'
+    win = Winhead(31, 41, 5, 4, 1, 2, "LL")
+    winds = Group(Window)
+    winds["1"] = Window(win, np.full((win.ny, win.nx), level, np.float32))
+    ccds = Group(CCD)
+    ccds["1"] = CCD(winds, 2048, 1024)
+    return MCCD(ccds, Header())
+
+
+class TestFrameCache(unittest.TestCase):
+    """Provides tests of the frame cache shared by HcamListSpool objects.
+
+    """
+
+    def setUp(self):
+        self.tdir = tempfile.mkdtemp()
+        self.fnames = []
+        for n in range(4):
+            fname = os.path.join(self.tdir, "frame{:d}.hcm".format(n))
+            fake_mccd(float(n)).write(fname)
+            self.fnames.append(fname)
+        spooler.HcamListSpool.cache_clear()
+
+    def tearDown(self):
+        spooler.HcamListSpool.cache_clear()
+        shutil.rmtree(self.tdir)
+
+    def read(self, fnames, cache_size):
+        # no read-ahead so that frames enter the cache in order
+        with spooler.HcamListSpool(
+            list(fnames), nprefetch=0, cache_size=cache_size
+        ) as spool:
+            return [mccd for mccd in spool]
+
+    def test_hit(self):
+        first = self.read(self.fnames, 4)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (0, 4, 4))
+        second = self.read(self.fnames, 4)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (4, 4, 4))
+        for mccd1, mccd2 in zip(first, second):
+            self.assertEqual(mccd1["1"]["1"].data[0, 0], mccd2["1"]["1"].data[0, 0])
+            self.assertEqual(mccd1.head["FILENAME"], mccd2.head["FILENAME"])
+
+    def test_off(self):
+        self.read(self.fnames, 0)
+        self.read(self.fnames, 0)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (0, 0, 0))
+
+    def test_eviction(self):
+        self.read(self.fnames, 2)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (0, 4, 2))
+
+        # only the last two read remain
+        self.read(self.fnames[2:], 2)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (2, 4, 2))
+        self.read(self.fnames[:1], 2)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (2, 5, 2))
+
+    def test_size_per_spool(self):
+        # a spool with a small cache_size does not limit a later larger one
+        self.read(self.fnames[:1], 1)
+        self.read(self.fnames, 4)
+        self.read(self.fnames, 4)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (5, 4, 4))
+
+    def test_clear(self):
+        self.read(self.fnames, 4)
+        spooler.HcamListSpool.cache_clear()
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (0, 0, 0))
+
+        # caching still works for spools made before or after the clear
+        self.read(self.fnames, 4)
+        self.read(self.fnames, 4)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (4, 4, 4))
+
+    def test_mtime(self):
+        self.read(self.fnames[:1], 4)
+        fake_mccd(10.0).write(self.fnames[0], overwrite=True)
+        mtime = os.path.getmtime(self.fnames[0])
+        os.utime(self.fnames[0], (mtime + 10, mtime + 10))
+
+        (mccd,) = self.read(self.fnames[:1], 4)
+        self.assertEqual(mccd["1"]["1"].data[0, 0], 10.0)
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (0, 2, 1))
+
+    def test_copy(self):
+        (mccd,) = self.read(self.fnames[1:2], 4)
+        mccd["1"]["1"].data[:] = -1.0
+        mccd.head["EXTRA"] = True
+
+        (mccd,) = self.read(self.fnames[1:2], 4)
+        self.assertTrue((mccd["1"]["1"].data == 1.0).all())
+        self.assertNotIn("EXTRA", mccd.head)
+
+
+class TestURL(unittest.TestCase):
+    """Provides tests of reading files from URLs with HcamListSpool.
+
+    """
+
+    def setUp(self):
+        tdir = tempfile.mkdtemp()
+        fname = os.path.join(tdir, "frame.hcm")
+        fake_mccd(3.0).write(fname)
+        with open(fname, "rb") as fp:
+            self.content = fp.read()
+        shutil.rmtree(tdir)
+        spooler.HcamListSpool.cache_clear()
+
+    def tearDown(self):
+        spooler.HcamListSpool.cache_clear()
+
+    def read(self, url, get):
+        with mock.patch.object(spooler.requests, "get", get):
+            with spooler.HcamListSpool([url], cache_size=4) as spool:
+                return [mccd for mccd in spool]
+
+    def test_fetch(self):
+        url = "http://example.com/frame?n=1"
+        get = mock.Mock(return_value=mock.Mock(content=self.content))
+        for n in range(2):
+            (mccd,) = self.read(url, get)
+            self.assertEqual(mccd["1"]["1"].data[0, 0], 3.0)
+            self.assertEqual(mccd.head["FILENAME"], url)
+
+        # fetched as given, with a timeout, each time as URLs are not cached
+        self.assertEqual(get.call_count, 2)
+        args, kwargs = get.call_args
+        self.assertEqual(args, (url,))
+        self.assertEqual(kwargs, {"timeout": spooler.URL_TIMEOUT})
+        self.assertEqual(spooler.HcamListSpool.cache_info(), (0, 0, 0))
+
+    def test_timeout(self):
+        get = mock.Mock(side_effect=requests.exceptions.ReadTimeout)
+        with self.assertRaises(HipercamError):
+            self.read("https://example.com/frame.hcm", get)
+
+
+class TestPrefetch(unittest.TestCase):
+    """Provides tests of the background read-ahead generator 'prefetch'.
+
+    """
+
+    def test_order(self):
+        frames = list(range(20))
+        self.assertEqual(list(spooler.prefetch(iter(frames))), frames)
+
+    def test_none(self):
+        # None indicates no new frame yet and must come through unchanged
+        frames = [1, None, None, 2, None, 3]
+        self.assertEqual(list(spooler.prefetch(iter(frames))), frames)
+
+    def test_empty(self):
+        self.assertEqual(list(spooler.prefetch(iter([]))), [])
+
+    def test_error(self):
+        def frames():
+            yield 1
+            raise ValueError("bad frame")
+
+        gen = spooler.prefetch(frames())
+        self.assertEqual(next(gen), 1)
+        with self.assertRaises(ValueError):
+            next(gen)
+
+    def test_close(self):
+        def slow():
+            for n in range(100):
+                time.sleep(0.01)
+                yield n
+
+        def workers():
+            return [
+                thread for thread in threading.enumerate()
+                if thread.name.startswith("ThreadPoolExecutor")
+            ]
+
+        nworkers = len(workers())
+        gen = spooler.prefetch(slow())
+        self.assertEqual(next(gen), 0)
+        self.assertEqual(next(gen), 1)
+
+        start = time.time()
+        gen.close()
+        self.assertLess(time.time() - start, 1.0)
+        self.assertLessEqual(len(workers()), nworkers)
+
+
+if __name__ == "__main__":
+    unittest.main()
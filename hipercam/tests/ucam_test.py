@@ -0,0 +1,112 @@
+import threading
+import unittest
+import urllib.error
+from concurrent.futures import wait
+from unittest import mock
+
+from hipercam import ucam
+from hipercam.ucam import _FrameFetcher
+
+
+class FakeServer:
+    """Stands in for the FileServer: frames up to 'navail' can be fetched,
+    later ones raise an HTTPError, as for a run still being written."""
+
+    def __init__(self, navail):
+        self.navail = navail
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def fetch(self, nframe):
+        with self.lock:
+            self.requests.append(nframe)
+            if nframe > self.navail:
+                raise urllib.error.HTTPError(
+                    "fake", 404, "no such frame", None, None
+                )
+        return "frame {:d}".format(nframe).encode()
+
+
+class TestFrameFetcher(unittest.TestCase):
+    """Provides tests of the read-ahead of frames from the ULTRACAM server.
+
+    """
+
+    def setUp(self):
+        self.server = FakeServer(3)
+        self.fetcher = _FrameFetcher(self.server.fetch, 4)
+
+    def tearDown(self):
+        self.fetcher.close()
+
+    def settle(self):
+        # waits for the requests made ahead to finish
+        wait(list(self.fetcher._jobs.values()))
+
+    def test_in_order(self):
+        for n in range(1, 4):
+            self.assertEqual(self.fetcher(n), "frame {:d}".format(n).encode())
+
+    def test_end_of_run(self):
+        for n in range(1, 4):
+            self.fetcher(n)
+        with self.assertRaises(urllib.error.HTTPError):
+            self.fetcher(4)
+
+    def test_frame_arrives_late(self):
+        # frame 4 was requested ahead, and failed, while reading frame 3;
+        # once the server has it, the first call must return it
+        for n in range(1, 4):
+            self.fetcher(n)
+        self.settle()
+        self.server.navail = 5
+        self.assertEqual(self.fetcher(4), b"frame 4")
+        self.assertEqual(self.fetcher(5), b"frame 5")
+
+    def test_frame_arrives_after_miss(self):
+        for n in range(1, 4):
+            self.fetcher(n)
+        with self.assertRaises(urllib.error.HTTPError):
+            self.fetcher(4)
+        self.server.navail = 6
+        for n in range(4, 7):
+            self.assertEqual(self.fetcher(n), "frame {:d}".format(n).encode())
+
+    def test_failed_read_ahead_retried(self):
+        # failed read-ahead requests are not kept once more frames arrive
+        self.fetcher(3)
+        self.settle()
+        self.server.navail = 10
+        self.fetcher(4)
+        self.fetcher._jobs[8].result()
+        for n in range(5, 9):
+            job = self.fetcher._jobs[n]
+            self.assertIsNone(job.exception())
+
+
+class TestRdataPrefetch(unittest.TestCase):
+    """Checks when Rdata reads frames ahead from the server.
+
+    """
+
+    def rdata(self, nframe):
+        def rhead(self, run, server):
+            self.server = server
+            self.mode = "FFCLR"
+
+        with mock.patch.object(ucam.Rhead, "__init__", rhead):
+            return ucam.Rdata("run001", nframe, True, nprefetch=4)
+
+    def test_prefetch(self):
+        rdat = self.rdata(1)
+        self.assertIsInstance(rdat._fetcher, _FrameFetcher)
+        rdat._fetcher.close()
+
+    def test_last(self):
+        # there are no frames ahead of the last, so none should be requested
+        rdat = self.rdata(0)
+        self.assertNotIsInstance(rdat._fetcher, _FrameFetcher)
+
+
+if __name__ == "__main__":
+    unittest.main()
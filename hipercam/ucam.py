@@ -11,6 +11,7 @@ import xml.dom.minidom
 import numpy as np
 import urllib.request
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 import inspect
 from astropy.io import fits
@@ -726,7 +727,7 @@ class Rdata(Rhead):
     This is much safer for code that accesses the data.
     """
 
-    def __init__(self, run, nframe=1, server=False, ccd=False):
+    def __init__(self, run, nframe=1, server=False, ccd=False, nprefetch=0):
         """Connects to a raw data file for reading. The file is kept open.
         The file pointer is set to the start of frame nframe. The Rdata
         object can then generate MCCD or CCD objects through being called
@@ -749,6 +750,12 @@ class Rdata(Rhead):
               :class:`trm.ultracam.MCCD` object if only one CCD per
               frame. Default is always to read as an MCCD.
 
+           nprefetch : int
+              number of frames to request from the server ahead of need
+              so that network latency overlaps with processing. Ignored
+              for local disk access and if nframe == 0, as then there
+              are no frames ahead to request.
+
         """
 
         Rhead.__init__(self, run, server)
@@ -769,6 +776,25 @@ class Rdata(Rhead):
             if self.nframe:
                 self.fp.seek(self.framesize * (self.nframe - 1))
 
+        if self.server and not self.last and nprefetch > 0:
+            self._fetcher = _FrameFetcher(self.fetch, nprefetch)
+        else:
+            self._fetcher = self.fetch
+
+    def __exit__(self, *args):
+        if isinstance(self._fetcher, _FrameFetcher):
+            self._fetcher.close()
+        super().__exit__(*args)
+
+    def fetch(self, nframe):
+        """Returns the raw bytes of frame nframe (starting from 1) from the
+        FileServer. Raises an HTTPError if the frame is not there.
+        """
+        full_url = "{:s}{:s}?action=get_frame&frame={:d}".format(
+            URL, self.run, nframe - 1
+        )
+        return urllib.request.urlopen(full_url).read()
+
     # and as an iterator.
     def __iter__(self):
         return self
@@ -940,12 +966,8 @@ class Rdata(Rhead):
         if self.server:
 
             # read timing and data in one go from the server
-            full_url = "{:s}{:s}?action=get_frame&frame={:d}".format(
-                URL, self.run, self.nframe - 1
-            )
-
             try:
-                buff = urllib.request.urlopen(full_url).read()
+                buff = self._fetcher(self.nframe)
 
                 # Re-format into the timing bytes and unsigned 2
                 # byte int data buffer
@@ -1460,6 +1482,61 @@ class Rdata(Rhead):
             raise UltracamError(" have not implemented anything for " + self.instrument)
 
 
+class _FrameFetcher:
+    """Wraps the fetch method of a server-mode :class:`Rdata` so that the
+    frames after the one asked for are requested in background threads,
+    ready for the next calls.
+    """
+
+    def __init__(self, fetch, nprefetch):
+        self._fetch = fetch
+        self.nprefetch = nprefetch
+        self._executor = ThreadPoolExecutor(nprefetch)
+        self._jobs = {}
+
+    def __call__(self, nframe):
+        job = self._jobs.pop(nframe, None)
+
+        # forget anything behind the frame wanted, e.g. after a jump
+        for n in [n for n in self._jobs if n < nframe]:
+            self._jobs.pop(n).cancel()
+
+        buff = None
+        if job is not None:
+            try:
+                buff = job.result()
+            except urllib.error.HTTPError:
+                # requested ahead before the server had the frame. It may
+                # have arrived since, so ask again below rather than report
+                # a stale failure.
+                pass
+
+        if buff is None:
+            try:
+                buff = self._fetch(nframe)
+            except urllib.error.HTTPError:
+                # we are at the end of the run as it stands, so any frames
+                # requested beyond will have failed too
+                self.close(False)
+                raise
+
+        # request the next frames while this one is processed, re-trying
+        # any that failed by being requested too early
+        for n in range(nframe + 1, nframe + 1 + self.nprefetch):
+            job = self._jobs.get(n)
+            if job is None or (job.done() and job.exception() is not None):
+                self._jobs[n] = self._executor.submit(self._fetch, n)
+
+        return buff
+
+    def close(self, shutdown=True):
+        for job in self._jobs.values():
+            job.cancel()
+        self._jobs.clear()
+        if shutdown:
+            self._executor.shutdown(wait=False)
+
+
 class Rtbytes(Rhead):
     """
     Iterator class to enable swift reading of Ultracam timing bytes. See
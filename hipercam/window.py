@@ -15,11 +15,10 @@ import numpy as np
 from numpy.lib.stride_tricks import as_strided
 
 from astropy.io import fits
-from astropy.convolution import Gaussian2DKernel, convolve, convolve_fft
+from astropy.convolution import Gaussian2DKernel, convolve_fft
 from scipy.ndimage.filters import maximum_filter
 from scipy.ndimage import gaussian_filter
 
-import matplotlib.pyplot as plt
 from .core import *
 from .group import *
 from .header import *
@@ -105,6 +105,7 @@ setup(
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage'],
+        'fast': ['bottleneck'],
     },
 
     # If there are data files included in your packages that need to be